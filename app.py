@@ -1,18 +1,29 @@
 # app.py
+import collections
 import os
+import shutil
 import sys
-import time
+import tempfile
+
+# Batch-1 inference is fastest on roughly the physical cores; extra threads only contend.
+# Set before numpy/onnxruntime are imported so their thread pools pick it up. A user's OMP_NUM_THREADS
+# is honored if it is a plain positive count; anything else (empty, nested "4,2", ...) falls back to the default.
+_omp_threads = os.environ.get("OMP_NUM_THREADS", "").strip()
+NUM_THREADS = int(_omp_threads) if _omp_threads.isdigit() and int(_omp_threads) > 0 else max(1, (os.cpu_count() or 2) // 2)
+os.environ.setdefault("OMP_NUM_THREADS", str(NUM_THREADS))
+os.environ.setdefault("MKL_NUM_THREADS", str(NUM_THREADS))
 
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel,
     QPushButton, QTextEdit, QMessageBox, QFrame, QProgressBar
 )
-from PyQt6.QtGui import QFont, QPixmap, QIcon
-from PyQt6.QtCore import Qt, QSize, QThread, pyqtSignal
+from PyQt6.QtGui import QFont, QImage, QPixmap, QPixmapCache, QIcon, QPainter
+from PyQt6.QtCore import Qt, QSize, QThread, QObject, QRunnable, QThreadPool, pyqtSignal
 
 # Machine Learning Imports
-from transformers import pipeline
-import torch
+from transformers import AutoConfig, AutoTokenizer
+import numpy as np
+import onnxruntime as ort
 
 # --- Helper Function for File Paths (for PyInstaller compatibility) ---
 def resource_path(relative_path):
@@ -25,9 +36,26 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
+def cached_pixmap(key, path, size=None):
+    """ Decodes (and optionally scales) an image, keeping it in QPixmapCache under `key` for any later lookup. """
+    pixmap = QPixmapCache.find(key)
+    if pixmap is None:
+        pixmap = QPixmap(path)
+        if pixmap.isNull():
+            return pixmap
+        if size is not None:
+            pixmap = pixmap.scaled(size, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+        QPixmapCache.insert(key, pixmap)
+    return pixmap
+
 # --- Project Configuration ---
 MODEL_DIR = resource_path("best_model")
+ONNX_MODEL_PATH = os.path.join(MODEL_DIR, "model_quant.onnx") # Exported on first launch, then shipped with the model
 IMAGE_DIR = resource_path("emoji_images")
+EMOJI_SIZE = QSize(56, 56)
+EMOJI_ATLAS_PATH = os.path.join(IMAGE_DIR, "emoji_atlas.npy") # Pre-decoded emojis, built by scripts/bake_emojis.py
+PREDICTION_CACHE_SIZE = 32 # Recent inputs whose predictions are kept, e.g. for repeated example clicks
+MAX_TOKENS = 64 # Tweets are short; capping the length bounds the quadratic attention cost on long pastes
 
 ID2IMAGE = {
     0: "heart.png", 1: "heart_eyes.png", 2: "joy.png", 3: "two_hearts.png", 4: "fire.png",
@@ -35,6 +63,31 @@ ID2IMAGE = {
     10: "camera.png", 11: "us_flag.png", 12: "sun.png", 13: "purple_heart.png", 14: "wink.png",
     15: "hundred.png", 16: "grin.png", 17: "tree.png", 18: "camera_flash.png", 19: "wink_tongue.png"
 }
+# Absolute image path per emoji id (None if the id has no image), built once at import
+ID2PATH = tuple(
+    os.path.join(IMAGE_DIR, ID2IMAGE[i]) if i in ID2IMAGE else None for i in range(max(ID2IMAGE) + 1)
+)
+
+def onnx_model_is_stale():
+    """ True if the cached ONNX model is missing or older than the weights/config it is exported from. """
+    if not os.path.exists(ONNX_MODEL_PATH):
+        return True
+    if getattr(sys, "frozen", False):
+        # File times in a PyInstaller bundle reflect extraction, not export; the bundled export matches the bundled weights
+        return False
+    export_mtime = os.path.getmtime(ONNX_MODEL_PATH)
+    return any(
+        os.path.getmtime(os.path.join(MODEL_DIR, name)) > export_mtime for name in ("model.safetensors", "config.json")
+    )
+
+def load_emoji_atlas():
+    """ Memory-maps the pre-decoded emoji atlas, or returns None if it is missing or doesn't match ID2PATH/EMOJI_SIZE. """
+    if not os.path.exists(EMOJI_ATLAS_PATH):
+        return None
+    atlas = np.load(EMOJI_ATLAS_PATH, mmap_mode="r")
+    if atlas.shape != (len(ID2PATH), EMOJI_SIZE.height(), EMOJI_SIZE.width(), 4):
+        return None
+    return atlas
 
 # --- Splash Screen: Shows while the heavy AI model is loading ---
 class SplashScreen(QWidget):
@@ -59,10 +112,9 @@ class SplashScreen(QWidget):
         splash_layout = QVBoxLayout(frame)
         
         logo_label = QLabel()
-        logo_path = os.path.join(IMAGE_DIR, "splash_logo.png")
-        if os.path.exists(logo_path):
-            pixmap = QPixmap(logo_path)
-            logo_label.setPixmap(pixmap.scaled(128, 128, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))
+        logo_pixmap = cached_pixmap("splash_logo", os.path.join(IMAGE_DIR, "splash_logo.png"), QSize(128, 128))
+        if not logo_pixmap.isNull():
+            logo_label.setPixmap(logo_pixmap)
         logo_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         splash_layout.addWidget(logo_label)
 
@@ -98,39 +150,161 @@ class ModelLoader(QThread):
     def run(self):
         try:
             self.progress.emit(10)
-            time.sleep(0.5) # Simulate initial steps for a smoother progress bar
-            self.progress.emit(30)
-            
-            model_pipeline = pipeline(
-                "text-classification", model=MODEL_DIR, tokenizer=MODEL_DIR,
-                top_k=None, device=-1 # Force CPU for max compatibility
-            )
-            
-            self.progress.emit(80)
-            time.sleep(0.5) # Simulate finalization
+            # Prefer the Rust tokenizer when one exists. BERTweet currently only ships the Python one, and it can't be
+            # swapped for e.g. BertTokenizerFast: its fastBPE vocab would be split differently and give wrong token ids.
+            tokenizer = AutoTokenizer.from_pretrained(MODEL_DIR, use_fast=True)
+            self.progress.emit(45)
+
+            # Emoji id for each logit position, parsed once from the "LABEL_X" names
+            id2label = AutoConfig.from_pretrained(MODEL_DIR).id2label
+            label_ids = np.array([int(id2label[i].split("_")[1]) for i in range(len(id2label))], dtype=np.int64)
+
+            # The ONNX export only happens on the first launch (or after the model changes); otherwise the cached file is reused
+            if onnx_model_is_stale():
+                self._export_onnx()
+            sess_options = ort.SessionOptions()
+            sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            sess_options.intra_op_num_threads = NUM_THREADS
+            sess_options.inter_op_num_threads = 1 # Single sequential graph, nothing to run in parallel
+            session = ort.InferenceSession(ONNX_MODEL_PATH, sess_options=sess_options, providers=["CPUExecutionProvider"])
+            self.progress.emit(85)
+
+            # The tokenizer may return extra fields (e.g. token_type_ids) the ONNX graph doesn't take
+            input_names = {model_input.name for model_input in session.get_inputs()}
+
+            # Throwaway prediction so the first real click doesn't pay the cold-start cost
+            warmup_inputs = tokenizer("warmup", return_tensors="np")
+            warmup_logits = session.run(None, {k: v for k, v in warmup_inputs.items() if k in input_names})[0][0]
+            top3(warmup_logits, label_ids)
             self.progress.emit(100)
-            self.finished.emit(model_pipeline) # Send the loaded model back
+            self.finished.emit((session, tokenizer, input_names, label_ids)) # Send the loaded model back
         except Exception as e:
             self.finished.emit(e) # Send the error back if loading fails
 
+    def _export_onnx(self):
+        """
+        Exports the PyTorch model to ONNX, fuses its graph and quantizes it to int8.
+        The result is bundled with the app, so it must stay portable across CPUs: hardware-specific
+        layout optimizations are left to the session's ORT_ENABLE_ALL at load time instead.
+        """
+        # Imported here since the export tooling is only needed once
+        from optimum.onnxruntime import ORTModelForSequenceClassification, ORTOptimizer, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig, OptimizationConfig
+
+        with tempfile.TemporaryDirectory() as export_dir:
+            ort_model = ORTModelForSequenceClassification.from_pretrained(
+                MODEL_DIR, export=True, provider="CPUExecutionProvider"
+            )
+            ort_model.save_pretrained(export_dir) # -> model.onnx
+            self.progress.emit(55)
+
+            # Gelu / LayerNorm / Attention fusion; level 1 keeps the graph hardware-independent
+            optimizer = ORTOptimizer.from_pretrained(ort_model)
+            optimizer.optimize(save_dir=export_dir, optimization_config=OptimizationConfig(optimization_level=1)) # -> model_optimized.onnx
+            self.progress.emit(70)
+
+            # Dynamic int8 quantization of the fused graph. reduce_range avoids u8s8 saturation on CPUs without VNNI.
+            quantizer = ORTQuantizer.from_pretrained(export_dir, file_name="model_optimized.onnx")
+            quantizer.quantize(
+                save_dir=export_dir,
+                quantization_config=AutoQuantizationConfig.avx2(is_static=False, per_channel=True, reduce_range=True)
+            ) # -> model_optimized_quantized.onnx
+
+            # Copy then rename, so an interrupted export never leaves a half-written cache behind
+            shutil.copy(os.path.join(export_dir, "model_optimized_quantized.onnx"), ONNX_MODEL_PATH + ".tmp")
+            os.replace(ONNX_MODEL_PATH + ".tmp", ONNX_MODEL_PATH)
+
+def top3(logits, label_ids):
+    """ Returns the top 3 emoji ids and their percentages (renormalized to sum to 100). """
+    top_idx = np.argpartition(-logits, 3)[:3]
+    top_idx = top_idx[np.argsort(-logits[top_idx])]
+    # Softmax renormalized over the top 3 is just a softmax of those 3 logits
+    top_exp = np.exp(logits[top_idx] - logits[top_idx[0]])
+    return label_ids[top_idx], top_exp / top_exp.sum() * 100.0
+
+# --- Prediction Worker: Runs a single prediction off the GUI thread ---
+class PredictionSignals(QObject):
+    """ Signals for PredictRunnable, since a QRunnable can't emit signals itself. """
+    finished = pyqtSignal(str, list) # input text, predictions
+    error = pyqtSignal(str)
+
+class PredictRunnable(QRunnable):
+    """
+    Runs the model on one input text in the global thread pool.
+    Emits the input text with its top 3 predictions as a list of (emoji id, percentage) pairs.
+    """
+    def __init__(self, session, tokenizer, input_names, label_ids, text):
+        super().__init__()
+        self.signals = PredictionSignals()
+        self.session = session
+        self.tokenizer = tokenizer
+        self.input_names = input_names
+        self.label_ids = label_ids
+        self.text = text
+
+    def run(self):
+        try:
+            # No padding needed for a single input
+            inputs = self.tokenizer(self.text, return_tensors="np", truncation=True, max_length=MAX_TOKENS)
+            logits = self.session.run(None, {k: v for k, v in inputs.items() if k in self.input_names})[0][0]
+            top_ids, top_pcts = top3(logits, self.label_ids)
+            self.signals.finished.emit(self.text, list(zip(top_ids.tolist(), top_pcts.tolist())))
+        except Exception as e:
+            self.signals.error.emit(str(e))
+
 # --- Main Application Window ---
 class EmojiPredictorApp(QWidget):
     """ The main GUI for the Tweet Emoji Predictor application. """
-    def __init__(self, model_pipeline):
+    def __init__(self, session, tokenizer, input_names, label_ids):
         super().__init__()
-        self.model_pipeline = model_pipeline
+        self.session = session
+        self.tokenizer = tokenizer
+        self.input_names = input_names
+        self._label_ids = label_ids
         self.first_prediction = True
+        self._prediction_runnable = None
+        self._prediction_cache = collections.OrderedDict() # input text -> predictions, least recently used first
+        self._load_emoji_pixmaps()
 
         self.setWindowTitle("Tweet Emoji Predictor")
         self.setGeometry(100, 100, 620, 720) 
         
-        icon_path = os.path.join(IMAGE_DIR, "app_icon.ico")
-        if os.path.exists(icon_path):
-            self.setWindowIcon(QIcon(icon_path))
+        icon_pixmap = cached_pixmap("app_icon", os.path.join(IMAGE_DIR, "app_icon.ico"))
+        if not icon_pixmap.isNull():
+            self.setWindowIcon(QIcon(icon_pixmap))
 
         self.setup_ui()
         self.apply_styles()
 
+    def _load_emoji_pixmaps(self):
+        """Decodes and scales every emoji image once, so predictions only swap pixmaps."""
+        # Shown when an emoji id has no (readable) image
+        fallback_pixmap = QPixmap(EMOJI_SIZE)
+        fallback_pixmap.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(fallback_pixmap)
+        font = painter.font()
+        font.setPixelSize(40)
+        painter.setFont(font)
+        painter.drawText(fallback_pixmap.rect(), Qt.AlignmentFlag.AlignCenter, "❓")
+        painter.end()
+
+        # Indexed directly by emoji id, with a slot for every id the model can emit (unknown ids show the fallback).
+        # The baked atlas is just a memcpy per emoji; the PNGs are the fallback.
+        atlas = load_emoji_atlas()
+        pixmaps = []
+        for emoji_id in range(max(len(ID2PATH), int(self._label_ids.max()) + 1)):
+            path = ID2PATH[emoji_id] if emoji_id < len(ID2PATH) else None
+            if path is None:
+                pixmap = QPixmap()
+            elif atlas is not None:
+                rgba = np.ascontiguousarray(atlas[emoji_id])
+                image = QImage(rgba.tobytes(), rgba.shape[1], rgba.shape[0], rgba.strides[0], QImage.Format.Format_RGBA8888)
+                pixmap = QPixmap.fromImage(image) if rgba[..., 3].any() else QPixmap() # Fully transparent tile = no image
+            else:
+                pixmap = cached_pixmap(f"emoji_{emoji_id}", path, EMOJI_SIZE)
+            pixmaps.append(fallback_pixmap if pixmap.isNull() else pixmap)
+        self._emoji_pixmaps = tuple(pixmaps)
+
     def setup_ui(self):
         """Creates and arranges all the widgets in the main window."""
         main_layout = QVBoxLayout(self)
@@ -156,9 +330,13 @@ class EmojiPredictorApp(QWidget):
         self.text_input = QTextEdit()
         self.text_input.setPlaceholderText("Feeling absolutely ecstatic about this project!")
         input_layout.addWidget(self.text_input)
-        predict_button = QPushButton("✨ Predict Emojis")
-        predict_button.clicked.connect(self.handle_prediction)
-        input_layout.addWidget(predict_button, alignment=Qt.AlignmentFlag.AlignCenter)
+        self.error_label = QLabel("Enter some text.")
+        self.error_label.setObjectName("error_label")
+        self.error_label.hide()
+        input_layout.addWidget(self.error_label)
+        self.predict_button = QPushButton("✨ Predict Emojis")
+        self.predict_button.clicked.connect(self.handle_prediction)
+        input_layout.addWidget(self.predict_button, alignment=Qt.AlignmentFlag.AlignCenter)
         main_layout.addWidget(input_frame)
 
         # --- Examples ---
@@ -168,6 +346,7 @@ class EmojiPredictorApp(QWidget):
         
         examples_layout = QVBoxLayout()
         examples_layout.setSpacing(6)
+        self.example_buttons = []
         example_tweets = [
             "That movie was so funny, I was in tears",
             "Missing the beach and sunshine right now",
@@ -178,6 +357,7 @@ class EmojiPredictorApp(QWidget):
             btn.setObjectName("example_button")
             btn.clicked.connect(lambda checked, text=tweet_text: self.load_example(text))
             examples_layout.addWidget(btn)
+            self.example_buttons.append(btn)
         main_layout.addLayout(examples_layout)
 
         # --- Results Card ---
@@ -203,7 +383,7 @@ class EmojiPredictorApp(QWidget):
             single_result_layout = QVBoxLayout()
             single_result_layout.setAlignment(Qt.AlignmentFlag.AlignCenter)
             emoji_image_label = QLabel()
-            emoji_image_label.setFixedSize(QSize(56, 56))
+            emoji_image_label.setFixedSize(EMOJI_SIZE)
             self.emoji_image_labels.append(emoji_image_label)
             single_result_layout.addWidget(emoji_image_label)
             emoji_percent_label = QLabel()
@@ -225,11 +405,13 @@ class EmojiPredictorApp(QWidget):
             QTextEdit { background-color: #FDFDFD; border: 1px solid #D8DEE3; border-radius: 8px; padding: 12px; font-size: 16px; color: #333333; min-height: 80px; }
             QPushButton { background-color: #007AFF; color: white; font-size: 16px; font-weight: bold; border: none; border-radius: 10px; padding: 11px 24px; min-width: 180px; }
             QPushButton:hover { background-color: #0056b3; }
+            QPushButton:disabled { background-color: #7FB8FF; }
             QLabel#example_title_label { color: #5A6978; font-size: 12px; font-weight: bold; margin-top: 5px; }
             QPushButton#example_button { background-color: #E9EDF1; color: #3A4754; font-size: 13px; font-weight: normal; padding: 9px; border-radius: 8px; }
             QPushButton#example_button:hover { background-color: #DDE2E6; }
             QLabel#results_title_label { font-size: 20px; font-weight: bold; color: #1E2A3A; margin-bottom: 10px; }
             QLabel#percentage_label { font-size: 26px; font-weight: bold; color: #007AFF; }
+            QLabel#error_label { font-size: 13px; color: #D93025; }
             QLabel#placeholder_label { font-size: 16px; color: #8A99A8; padding: 30px; }
         """)
 
@@ -238,62 +420,71 @@ class EmojiPredictorApp(QWidget):
         self.text_input.setText(text)
         self.handle_prediction()
 
+    def set_busy(self, busy):
+        """Locks the prediction buttons while a prediction is running."""
+        self.predict_button.setEnabled(not busy)
+        self.predict_button.setText("⏳ Predicting..." if busy else "✨ Predict Emojis")
+        for btn in self.example_buttons:
+            btn.setEnabled(not busy)
+
     def handle_prediction(self):
-        """Processes the input text and displays the top 3 emoji predictions."""
+        """Validates the input text and starts a background prediction for it."""
+        self.error_label.hide()
         input_text = self.text_input.toPlainText().strip()
         if not input_text:
-            QMessageBox.warning(self, "Input Error", "Please enter some text to predict.")
+            self.error_label.show()
             return
 
-        try:
-            # On the first prediction, switch from the placeholder to the results view
-            if self.first_prediction:
-                self.placeholder_label.hide()
-                self.results_container.show()
-                self.first_prediction = False
-
-            raw_predictions = self.model_pipeline(input_text)[0]
-            
-            # Process scores to get the top 3 and normalize them to sum to 100%
-            processed_predictions = [{'id': int(p['label'].split('_')[1]), 'score': p['score']} for p in raw_predictions]
-            top3_predictions = sorted(processed_predictions, key=lambda x: x['score'], reverse=True)[:3]
-            sum_top3_scores = sum(p['score'] for p in top3_predictions)
-
-            # Update the UI with the results
-            for i in range(3):
-                if i < len(top3_predictions):
-                    prediction = top3_predictions[i]
-                    percentage = (prediction['score'] / sum_top3_scores) * 100 if sum_top3_scores > 0 else 0
-                    emoji_filename = ID2IMAGE.get(prediction['id'])
-                    
-                    if emoji_filename:
-                        emoji_path = os.path.join(IMAGE_DIR, emoji_filename)
-                        if os.path.exists(emoji_path):
-                            pixmap = QPixmap(emoji_path)
-                            scaled_pixmap = pixmap.scaled(self.emoji_image_labels[i].size(), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-                            self.emoji_image_labels[i].setPixmap(scaled_pixmap)
-                        else: self.emoji_image_labels[i].setText("❓")
-                    else: self.emoji_image_labels[i].setText("❓")
-
-                    self.emoji_percent_labels[i].setText(f"{percentage:.1f}%")
-                else:
-                    # Clear any unused result slots
-                    self.emoji_image_labels[i].clear()
-                    self.emoji_percent_labels[i].setText("")
+        if input_text in self._prediction_cache:
+            self._prediction_cache.move_to_end(input_text)
+            self.show_predictions(self._prediction_cache[input_text])
+            return
 
-        except Exception as e:
-            QMessageBox.critical(self, "Prediction Error", f"An error occurred during prediction:\n{e}")
+        self.set_busy(True)
+        runnable = PredictRunnable(self.session, self.tokenizer, self.input_names, self._label_ids, input_text)
+        runnable.signals.finished.connect(self.on_prediction_finished)
+        runnable.signals.error.connect(self.show_prediction_error)
+        self._prediction_runnable = runnable # Keeps its signals alive until they are delivered
+        QThreadPool.globalInstance().start(runnable)
+
+    def on_prediction_finished(self, input_text, predictions):
+        """Caches a finished background prediction and displays it."""
+        self._prediction_cache[input_text] = predictions
+        if len(self._prediction_cache) > PREDICTION_CACHE_SIZE:
+            self._prediction_cache.popitem(last=False)
+        self.show_predictions(predictions)
+
+    def show_predictions(self, predictions):
+        """Displays the top 3 (emoji id, percentage) predictions."""
+        self.set_busy(False)
+
+        # On the first prediction, switch from the placeholder to the results view
+        if self.first_prediction:
+            self.placeholder_label.hide()
+            self.results_container.show()
+            self.first_prediction = False
+
+        for i, (emoji_id, percentage) in enumerate(predictions):
+            self.emoji_image_labels[i].setPixmap(self._emoji_pixmaps[emoji_id])
+            self.emoji_percent_labels[i].setText(f"{percentage:.1f}%")
+
+    def show_prediction_error(self, message):
+        """Reports a failed prediction."""
+        self.set_busy(False)
+        QMessageBox.critical(self, "Prediction Error", f"An error occurred during prediction:\n{message}")
 
 # --- Main Execution Block ---
 if __name__ == '__main__':
     app = QApplication(sys.argv)
-    splash = SplashScreen()
-    splash.show()
     
     # This global variable is a simple way to hold a reference to the main window
     # after the splash screen closes.
     main_window = None
 
+    def on_progress(value):
+        """Forwards the loader's progress to the splash screen."""
+        splash.update_progress(value)
+
     def on_model_loaded(result):
         """Callback function that runs when the model loader thread finishes."""
         global main_window
@@ -304,13 +495,18 @@ if __name__ == '__main__':
             sys.exit(1)
         else:
             # Model loaded successfully, create and show the main application window
-            main_window = EmojiPredictorApp(model_pipeline=result)
+            session, tokenizer, input_names, label_ids = result
+            main_window = EmojiPredictorApp(session, tokenizer, input_names, label_ids)
             main_window.show()
 
-    # Start the model loading in the background
+    # Start the model loading in the background before building the splash, so the two overlap.
+    # Queued connections only run the callbacks from the event loop, by which point the splash exists.
     loader = ModelLoader()
-    loader.progress.connect(splash.update_progress)
-    loader.finished.connect(on_model_loaded)
-    loader.start()
+    loader.progress.connect(on_progress, Qt.ConnectionType.QueuedConnection)
+    loader.finished.connect(on_model_loaded, Qt.ConnectionType.QueuedConnection)
+    loader.start(QThread.Priority.HighPriority)
+
+    splash = SplashScreen()
+    splash.show()
     
     sys.exit(app.exec())
\ No newline at end of file
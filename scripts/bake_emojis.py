@@ -0,0 +1,35 @@
+# scripts/bake_emojis.py
+"""
+Pre-decodes every emoji image into a single RGBA atlas (emoji_images/emoji_atlas.npy).
+The app memory-maps the atlas at startup instead of decoding and scaling 20 PNGs.
+Re-run this whenever an emoji image, ID2IMAGE or EMOJI_SIZE changes:
+
+    python scripts/bake_emojis.py
+"""
+import os
+import sys
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# app.py resolves its resources relative to the working directory
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT_DIR)
+sys.path.insert(0, ROOT_DIR)
+from app import EMOJI_ATLAS_PATH, EMOJI_SIZE, ID2PATH
+
+def bake_emoji(path, width, height):
+    """Decodes one image and fits it, centered, into a transparent width x height RGBA tile."""
+    tile = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    if path and os.path.exists(path):
+        image = ImageOps.contain(Image.open(path).convert("RGBA"), (width, height), Image.Resampling.LANCZOS)
+        tile.paste(image, ((width - image.width) // 2, (height - image.height) // 2))
+    else:
+        print(f"Missing image, leaving a blank tile: {path}")
+    return np.asarray(tile, dtype=np.uint8)
+
+if __name__ == '__main__':
+    width, height = EMOJI_SIZE.width(), EMOJI_SIZE.height()
+    atlas = np.stack([bake_emoji(path, width, height) for path in ID2PATH]) # (num_emojis, height, width, 4)
+    np.save(EMOJI_ATLAS_PATH, atlas)
+    print(f"Wrote {atlas.shape} atlas to {EMOJI_ATLAS_PATH}")